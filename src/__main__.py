@@ -14,14 +14,16 @@ def motionTrackingProcess(in_queue, out_queue):
     :param in_queue: array of received data
     :param out_queue: array of sent data
     """
-    camera, master = cameraStart(), None  # Init camera
+    camera, master = CaptureThread(cameraStart()), None  # Init camera
+    camera.start()  # Grab frames in the background
+    buffers = FrameBuffers.allocate(width, height)  # Init frame buffers
 
     # Init cluster parameters
     criteria, clusterNumber, clusterA, clusterB, center, previousCenter = clusterParams(multiTouch)
 
     while True:
         # Manipulate images
-        master, contours, hierarchy, frames, result = imageProcessing(camera, master)
+        master, contours, hierarchy, frames, result = imageProcessing(camera, master, buffers)
         if result == 'break':
             break
         elif result == 'continue':
@@ -44,14 +46,10 @@ def motionTrackingProcess(in_queue, out_queue):
                 numContours += len(i)
             # Contour points needed to detect motion
             if numContours >= contourDetectionPoints:
-                # Take random number of contour points
-                if numRandomContours > 0:
-                    contours = [random.sample(listDimensionRemover(contours, 1), numRandomContours)]
-                clusterA, clusterB, center, ret = contourClustering(contours, criteria, clusterNumber, multiTouch)
-                # Centroid tracking
+                clusterA, clusterB, center, ret = contourClustering(contours, criteria, clusterNumber,
+                                                                    multiTouch, previousCenter)
+                # Centroid tracking: contourClustering orders clusters by the previous centers
                 if multiTouch:
-                    if len(previousCenter) != 0:
-                        clusterA, clusterB, center = centroidTracking(clusterA, clusterB, center, previousCenter)
                     previousCenter = center
 
         # Input A: Calculate closest contour point to closest game object particle
@@ -71,7 +69,7 @@ def motionTrackingProcess(in_queue, out_queue):
             if showCentroid:
                 dataPackage.append(center)
             if displayFrames:
-                dataPackage.append(frames)
+                dataPackage.append([frame.copy() for frame in frames])  # Frame buffers are reused
             out_queue.put(dataPackage)  # Send data
 
     camera.release()  # Release camera
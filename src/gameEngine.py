@@ -66,33 +66,21 @@ def closestContour(cluster, ptcCoordinates, distanceRadius, multiTouch):
     :param multiTouch: boolean about enabling multi touch
     :return: coordinates of the clusters' closest contour point to closest game object particle
     """
-    minCoordinatesCluster = [0, 0]
-    minDistance = float('inf')  # Set initial minimum distance
-    distanceListCluster = []
     sIdx = 1
     if multiTouch:
         sIdx = 2
-    for i in range(len(ptcCoordinates) - sIdx):
-        for j in cluster:
-            distanceListCluster.append(math.sqrt((ptcCoordinates[sIdx + i][0] - j[0]) ** 2 +
-                                                 (ptcCoordinates[sIdx + i][1] - j[1]) ** 2))
-            if minDistance > distanceListCluster[-1] >= distanceRadius:
-                minDistance = distanceListCluster[-1]
-                minCoordinatesCluster = j
-    return minCoordinatesCluster
-
-
-# Remove n dimensions
-def listDimensionRemover(processList, numberOfDimensions):
-    """
-    :param processList: list array
-    :param numberOfDimensions: number of dimensions to flatten
-    :return: flattened list by n dimensions
-    """
-    flat_list = [item for sublist in processList for item in sublist]
-    if numberOfDimensions == 1:
-        return flat_list
-    return listDimensionRemover(flat_list, numberOfDimensions - 1)
+    cluster = np.asarray(cluster).reshape(-1, 2)
+    particleCoordinates = np.asarray(ptcCoordinates[sIdx:], dtype=np.float64).reshape(-1, 2)
+    if len(cluster) == 0 or len(particleCoordinates) == 0:
+        return [0, 0]
+
+    # Squared distances between all game object particles (rows) and contour points (columns)
+    distances = ((particleCoordinates[:, None] - cluster[None]) ** 2).sum(axis=-1)
+    distances[distances < distanceRadius ** 2] = np.inf  # Ignore contour points inside the particle
+    minIdx = int(np.argmin(distances))  # First minimum in particle, then contour point order
+    if distances.flat[minIdx] == np.inf:
+        return [0, 0]
+    return cluster[minIdx % len(cluster)]
 
 
 # Update attributes for input
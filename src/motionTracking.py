@@ -5,6 +5,9 @@ Motion tracking of contours via camera
 # Imports
 import os
 import math
+import queue
+import threading
+from dataclasses import dataclass
 import numpy as np
 import cv2
 import pygame
@@ -26,15 +29,20 @@ cameraAutodetect = False
 resolution = "FullHD"  # 'FullHD', 'HD', 'SD'
 cameraID = 0  # Camera device index (only when camera autodetect is off)
 cameraFps = 30
-contourDetectionPoints = 650  # Indicates how many contour points needed to detect motion
-numRandomContours = 500  # 0 = Original contour points; needs to be smaller/equal than contour detection points
-gaussianBlurKSize = (31, 31)  # Odd number required
+captureQueueSize = 2  # Frames buffered between capture and processing; oldest frame is dropped when full
+contourDetectionPoints = 325  # Indicates how many contour points needed to detect motion (at processing resolution)
+numRandomContours = 500  # 0 = Original contour points; otherwise contour points are subsampled before clustering
+processingScale = 2  # Frames are processed at half resolution (cv2.pyrDown)
+gaussianBlurKSize = (15, 15)  # Odd number required
+motionCheckSize = (80, 45)  # Thumbnail size used to detect static frames
+motionTolerance = 2  # Largest thumbnail pixel difference (0-255) below which a frame counts as static
 thresholdValue = 5
 thresholdMaxValue = 255
-erodingIter = 4
-dilatingIter = 8
-clusteringIter = 10
-clusteringEpsilon = 1.0
+morphKernelSize = (3, 3)  # Opening followed by one dilation; matches eroding 2x and dilating 4x with a 2x2 kernel
+clusteringIter = 3
+clusteringEpsilon = 2.0
+splitIter = 5  # Threshold refinement passes of the two-cluster principal axis split
+splitEpsilon = 0.5  # Threshold shift (pixels along the principal axis) at which the refinement stops
 showContours = True
 showCentroid = True
 centroidSize = 25  # Integer required
@@ -48,6 +56,12 @@ elif resolution == "HD":
 elif resolution == "SD":
     width, height = 1024, 576
 
+randomGenerator = np.random.default_rng()  # Contour point subsampling
+morphKernel = cv2.getStructuringElement(cv2.MORPH_RECT, morphKernelSize)  # Opening/dilating kernel
+kmeansPoints = np.empty((max(numRandomContours, 1), 2), np.float32)  # Clustering input, reused across frames
+kmeansLabels = np.empty(max(numRandomContours, 1), np.int32)  # Clustering labels, reused across frames
+previewBuffers = None  # Debug preview mosaic, allocated on first use
+
 
 # Convert from fourcc numerical code to fourcc string character code
 def decode_fourcc(cc):
@@ -63,49 +77,158 @@ def cameraStart():
     """
     :return: video input
     """
+    index, backend = cameraID, cv2.CAP_DSHOW
     if cameraAutodetect:
-        camera = cv2.VideoCapture(0, cv2.CAP_ANY)
+        index, backend = 0, cv2.CAP_ANY
+    hwAcceleration = hasattr(cv2, 'CAP_PROP_HW_ACCELERATION')  # Requires OpenCV 4.5.2+
+    if hwAcceleration:  # Decode MJPG on the GPU where the backend supports it
+        camera = cv2.VideoCapture(index, backend, [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
     else:
-        camera = cv2.VideoCapture(cameraID, cv2.CAP_DSHOW)
+        camera = cv2.VideoCapture(index, backend)
     camera.set(3, width)
     camera.set(4, height)
     camera.set(5, cameraFps)
     camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Keep only the latest frame in the driver
     print("Camera backend:", camera.getBackendName())
     print("Codec:", decode_fourcc(camera.get(6)))
+    if hwAcceleration:
+        print("Hardware acceleration:", int(camera.get(cv2.CAP_PROP_HW_ACCELERATION)))
     return camera
 
 
+# Threaded camera capture
+class CaptureThread(threading.Thread):
+    """
+    Camera capture thread: grabs the next frame while the current one is processed
+    """
+    def __init__(self, camera):
+        super().__init__(daemon=True)
+        self.camera = camera
+        self.frames = queue.Queue(maxsize=captureQueueSize)
+        self.stopped = threading.Event()
+        self.error = None
+
+    def run(self):
+        """
+        Grab frames until the feed ends or the thread is stopped
+        """
+        grabbed = True
+        try:
+            while grabbed and not self.stopped.is_set():
+                grabbed, frame = self.camera.read()
+                self.put((grabbed, frame))
+        except Exception as error:  # Handed over to the consumer in read()
+            self.error = error
+        finally:
+            self.put((False, None))  # Always end the feed, so read() never blocks forever
+
+    def put(self, item):
+        """
+        :param item: grab status and frame
+        """
+        while True:
+            try:
+                self.frames.put_nowait(item)
+                return
+            except queue.Full:  # Drop the oldest frame to keep latency bounded
+                try:
+                    self.frames.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def read(self):
+        """
+        :return: grab status and frame, same as cv2.VideoCapture.read
+        """
+        grabbed, frame = self.frames.get()
+        if not grabbed and self.error is not None:
+            raise self.error
+        return grabbed, frame
+
+    def release(self):
+        """
+        Stop capturing and release the camera
+        """
+        self.stopped.set()
+        self.join()
+        self.camera.release()
+
+
+# Preallocated frames
+@dataclass
+class FrameBuffers:
+    """
+    Frame buffers reused by image processing
+    """
+    gray: np.ndarray
+    small: np.ndarray
+    blur: np.ndarray
+    delta: np.ndarray
+    thresh: np.ndarray
+    eroded: np.ndarray
+    dilated: np.ndarray
+    tiny: np.ndarray
+    previousTiny: np.ndarray
+
+    @classmethod
+    def allocate(cls, frameWidth, frameHeight):
+        """
+        :param frameWidth: camera frame width
+        :param frameHeight: camera frame height
+        :return: frame buffers
+        """
+        smallShape = ((frameHeight + 1) // 2, (frameWidth + 1) // 2)  # cv2.pyrDown output size
+        tinyShape = (motionCheckSize[1], motionCheckSize[0])
+        return cls(np.empty((frameHeight, frameWidth), np.uint8),
+                   *(np.empty(smallShape, np.uint8) for _ in range(6)),
+                   *(np.empty(tinyShape, np.uint8) for _ in range(2)))
+
+
 # Manipulate images
-def imageProcessing(camera, master):
+def imageProcessing(camera, master, buffers):
     """
     :param camera: video input
     :param master: frame placeholder
+    :param buffers: preallocated frame buffers
     :return: manipulated images
     """
     (grabbed, frame0) = camera.read()  # Grab a frame
     if not grabbed:  # End of feed
         return None, None, None, None, 'break'
 
-    frame1 = cv2.cvtColor(frame0, cv2.COLOR_BGR2GRAY)  # Gray frame
-    frame2 = cv2.GaussianBlur(frame1, gaussianBlurKSize, 0)  # Blur frame
+    frame1 = cv2.cvtColor(frame0, cv2.COLOR_BGR2GRAY, dst=buffers.gray)  # Gray frame
+    frameSmall = cv2.pyrDown(frame1, dst=buffers.small)
+    frame2 = cv2.GaussianBlur(frameSmall, gaussianBlurKSize, 0, dst=buffers.blur)  # Downscaled blur frame
+    frameTiny = cv2.resize(frame2, motionCheckSize, dst=buffers.tiny, interpolation=cv2.INTER_AREA)
+    previousTiny = buffers.previousTiny
+    buffers.tiny, buffers.previousTiny = previousTiny, frameTiny
 
     # Initialize master
     if master is None:
-        master = frame2
+        master, buffers.blur = frame2, np.empty_like(frame2)
         return master, None, None, None, 'continue'
 
-    frame3 = cv2.absdiff(master, frame2)  # Delta frame
-    frame4 = cv2.threshold(frame3, thresholdValue, thresholdMaxValue, cv2.THRESH_BINARY)[1]  # Threshold frame
-
-    # Dilate the thresholded image to fill in holes
-    kernel = np.ones((2, 2), np.uint8)
-    frame5 = cv2.erode(frame4, kernel, iterations=erodingIter)
-    frame5 = cv2.dilate(frame5, kernel, iterations=dilatingIter)  # Dialated frame
-
-    # Find contours on thresholded image
-    contours, hierarchy = cv2.findContours(frame5.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    master = frame2  # Update master
+    # Static frame: no motion to find, skip delta, threshold and morphology
+    if cv2.norm(frameTiny, previousTiny, cv2.NORM_INF) < motionTolerance:
+        master, buffers.blur = frame2, master  # Update master
+        if displayFrames:
+            for frame in (buffers.delta, buffers.thresh, buffers.dilated):
+                frame.fill(0)
+        frames = [frame0, frame1, frame2, buffers.delta, buffers.thresh, buffers.dilated]  # Collect frames
+        return master, [], None, frames, 'None'
+
+    frame3 = cv2.absdiff(master, frame2, dst=buffers.delta)  # Delta frame
+    frame4 = cv2.threshold(frame3, thresholdValue, thresholdMaxValue, cv2.THRESH_BINARY,
+                           dst=buffers.thresh)[1]  # Threshold frame
+
+    # Open the thresholded image to remove noise, then dilate it to fill in holes
+    frame5 = cv2.morphologyEx(frame4, cv2.MORPH_OPEN, morphKernel, dst=buffers.eroded)
+    frame5 = cv2.dilate(frame5, morphKernel, dst=buffers.dilated)  # Dialated frame
+
+    # Find contours on thresholded image (OpenCV 3.2+ leaves the source image untouched)
+    contours, hierarchy = cv2.findContours(frame5, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    master, buffers.blur = frame2, master  # Update master; old master is the next blur buffer
     frames = [frame0, frame1, frame2, frame3, frame4, frame5]  # Collect frames
     return master, contours, hierarchy, frames, 'None'
 
@@ -125,58 +248,144 @@ def clusterParams(multiTouch):
     return criteria, clusterNumber, clusterA, clusterB, center, []
 
 
+# Reserve clustering scratch arrays
+def kmeansScratch(numPoints):
+    """
+    :param numPoints: number of contour points
+    :return: float32 point and int32 label arrays of length numPoints
+    """
+    global kmeansPoints, kmeansLabels
+    if numPoints > len(kmeansPoints):  # Grow only when more points arrive than ever before
+        kmeansPoints = np.empty((numPoints, 2), np.float32)
+        kmeansLabels = np.empty(numPoints, np.int32)
+    return kmeansPoints[:numPoints], kmeansLabels[:numPoints]
+
+
+# Split contour points in two along their principal axis
+def principalAxisSplit(points, label):
+    """
+    :param points: array of contour coordinates
+    :param label: array to store the cluster labels in
+    :return: cluster centers, None if the split is degenerate
+    """
+    mean = points.mean(axis=0)
+    centered = points - mean
+    (cxx, cxy), (_, cyy) = centered.T @ centered  # 2x2 covariance (unnormalized)
+
+    # Top eigenvector of the symmetric 2x2 matrix in closed form
+    angle = 0.5 * math.atan2(2.0 * cxy, cxx - cyy)
+    projection = centered @ np.array([math.cos(angle), math.sin(angle)], dtype=np.float32)
+
+    # Threshold at the median, then refine it as 1-D kmeans on the projection
+    threshold = np.median(projection)
+    for _ in range(splitIter):
+        upper = projection > threshold
+        numB = int(np.count_nonzero(upper))
+        if numB == 0 or numB == len(upper):
+            return None
+        newThreshold = 0.5 * (projection[~upper].mean() + projection[upper].mean())
+        if abs(newThreshold - threshold) < splitEpsilon:
+            break
+        threshold = newThreshold
+
+    np.greater(projection, threshold, out=label)
+    numB = int(np.count_nonzero(label))
+    if numB == 0 or numB == len(label):
+        return None
+    center = np.array([points[label == 0].mean(axis=0), points[label == 1].mean(axis=0)], dtype=np.float32)
+
+    # One 2-D Lloyd step: reassign points to their nearest center and update the centers
+    distances = ((points[:, None] - center[None]) ** 2).sum(axis=-1)
+    label[:] = distances.argmin(axis=1)
+    numB = int(np.count_nonzero(label))
+    if numB == 0 or numB == len(label):
+        return None
+    center = np.array([points[label == 0].mean(axis=0), points[label == 1].mean(axis=0)], dtype=np.float32)
+    return center
+
+
 # Clustering contour points
-def contourClustering(contours, criteria, clusterNumber, multiTouch):
+def contourClustering(contours, criteria, clusterNumber, multiTouch, previousCenter):
     """
     :param contours: array of contour coordinates
     :param criteria: parameters for clustering
     :param clusterNumber: number of clusters to be generated
     :param multiTouch: boolean about enabling multi touch
+    :param previousCenter: array of previous center coordinates
     :return: clustered contours and corresponding centroid
     """
-    contourCoordinates = []
-    for i in contours:
-        for j in range(len(i)):
-            contourCoordinates.append(i[j][0])  # Save contour point coordinates
-
-    contourCoordinates = np.float32(contourCoordinates)
-    ret, label, center = cv2.kmeans(contourCoordinates, clusterNumber, None,
-                                    criteria, 10, cv2.KMEANS_RANDOM_CENTERS)  # Apply kmeans clustering
-    clusterA = contourCoordinates[label.ravel() == 0]  # Cluster input A
+    if len(contours) == 0:
+        return [], [], [[0, 0], [0, 0]], 0.0
+
+    # Save contour point coordinates as one contiguous (N, 2) array
+    contourCoordinates = np.concatenate([np.reshape(i, (-1, 2)) for i in contours])
+
+    # Take random number of contour points before clustering
+    if 0 < numRandomContours < len(contourCoordinates):
+        sample = randomGenerator.choice(len(contourCoordinates), numRandomContours, replace=False)
+        contourCoordinates = contourCoordinates[sample]
+
+    # Order points by x: clusters are mostly left/right separated, so labels come in runs
+    if clusterNumber == 2:
+        contourCoordinates = contourCoordinates[np.argsort(contourCoordinates[:, 0], kind='stable')]
+    contourCoordinates = contourCoordinates.astype(np.int16)  # Clusters keep int16 coordinates
+    contourCoordinates *= processingScale  # Back to camera resolution
+
+    # Write float32 points into the C-contiguous scratch array required by cv2.kmeans
+    points, label = kmeansScratch(len(contourCoordinates))
+    points[:] = contourCoordinates
+
+    # Single cluster: the optimal centroid is the mean of all points
+    if clusterNumber == 1:
+        center = points.mean(axis=0, keepdims=True)
+        ret = float(((points - center) ** 2).sum())  # Compactness as returned by kmeans
+        return contourCoordinates, [], center, ret
+
+    center = None
+    if clusterNumber == 2:
+        center = principalAxisSplit(points, label)
+    if center is None:  # Degenerate split: fall back to kmeans
+        ret, label, center = cv2.kmeans(points, clusterNumber, label, criteria, 1, cv2.KMEANS_PP_CENTERS)
+    else:
+        ret = float(((points - center[label]) ** 2).sum())  # Compactness as returned by kmeans
+    label = label.ravel()
+
+    # Centroid tracking: cluster A is the one closest to the previous center A
+    if clusterNumber == 2 and len(previousCenter) == 2:
+        previousCenterA = np.asarray(previousCenter[0], dtype=np.float32)
+        if ((center[1] - previousCenterA) ** 2).sum() < ((center[0] - previousCenterA) ** 2).sum():
+            label ^= 1
+            center = center[::-1].copy()
+
+    # Group points by label with one stable sort; points stay ordered by x within each cluster
+    order = np.argsort(label, kind='stable')
+    numA = int(np.count_nonzero(label == 0))
+    clusterA = contourCoordinates[order[:numA]]  # Cluster input A
     clusterB = []
     if multiTouch:
-        clusterB = contourCoordinates[label.ravel() == 1]  # Cluster input B
+        clusterB = contourCoordinates[order[numA:]]  # Cluster input B
     return clusterA, clusterB, center, ret
 
 
-# Tracking centroid
-def centroidTracking(clusterA, clusterB, center, previousCenter):
+# Render points as 2x2 pixel dots, like a radius 1 circle
+def drawPoints(screen, points, color):
     """
-    :param clusterA: array of clustered contour coordinates
-    :param clusterB: array of clustered contour coordinates
-    :param center: array of center coordinates
-    :param previousCenter: array of previous center coordinates
-    :return: relabeled cluster and center
+    :param screen: pygame screen
+    :param points: array of point coordinates
+    :param color: RGB color
     """
-    comparisonCenterCoordinates = []
-    comparisonCenterCoordinates.extend([center[0], center[1], previousCenter[1]])
-
-    # Find smallest distance between previous center A and previous/current centers' coordinates
-    minDistance = float('inf')  # Set initial minimum distance
-    distanceListCenter, minCoordinatesCenter = [], [0, 0]
-    for i in comparisonCenterCoordinates:
-        distanceListCenter.append(math.sqrt((previousCenter[0][0] - i[0]) ** 2 +
-                                            (previousCenter[0][1] - i[1]) ** 2))
-        if distanceListCenter[-1] < minDistance:
-            minDistance = distanceListCenter[-1]
-            minCoordinatesCenter = i
-    # If smallest distance is center B: swap both cluster and center
-    if (minCoordinatesCenter == comparisonCenterCoordinates[1]).all():
-        tmpClusterA = clusterA
-        clusterA = clusterB
-        clusterB = tmpClusterA
-        center = [center[1], center[0]]
-    return clusterA, clusterB, center
+    points = np.asarray(points, dtype=np.intp).reshape(-1, 2)  # Clusters already hold integer coordinates
+    if screen.get_bitsize() == 24:  # No 2D pixel array for 24-bit surfaces: fill each dot instead
+        screenRect = screen.get_rect()
+        for x, y in points.tolist():
+            screen.fill(color, screenRect.clip((x - 1, y - 1, 2, 2)))
+        return
+    xs = (points[:, 0, None] - (0, 1, 0, 1)).ravel()
+    ys = (points[:, 1, None] - (0, 0, 1, 1)).ravel()
+    pixels = pygame.surfarray.pixels2d(screen)  # Locks the screen
+    inside = (xs >= 0) & (xs < pixels.shape[0]) & (ys >= 0) & (ys < pixels.shape[1])
+    pixels[xs[inside], ys[inside]] = screen.map_rgb(color)
+    del pixels  # Unlock the screen
 
 
 # Display contours
@@ -188,13 +397,9 @@ def displayContours(data, screen, sContours, multiTouch):
     :param multiTouch: boolean about enabling multi touch
     """
     if sContours:
-        for i in range(len(data[2])):
-            pygame.draw.circle(screen, RED, (int(round(data[2][i][0])),
-                                             int(round(data[2][i][1]))), 1)  # Render cluster A
+        drawPoints(screen, data[2], RED)  # Render cluster A
         if multiTouch:
-            for i in range(len(data[3])):
-                pygame.draw.circle(screen, BLUE, (int(round(data[3][i][0])),
-                                                  int(round(data[3][i][1]))), 1)  # Render cluster B
+            drawPoints(screen, data[3], BLUE)  # Render cluster B
 
 
 # Display input
@@ -227,11 +432,32 @@ def displayCentroid(data, screen, sContours, sCentroid, cSize, multiTouch):
         cidx = 4
         if sContours is False:
             cidx = 2
-        pygame.draw.circle(screen, GOLD, (int(round(data[cidx][0][0])),
-                                          int(round(data[cidx][0][1]))), cSize)  # Render centroid cluster A
+        center = np.rint(data[cidx]).astype(np.int32).tolist()
+        pygame.draw.circle(screen, GOLD, center[0], cSize)  # Render centroid cluster A
         if multiTouch:
-            pygame.draw.circle(screen, GOLD, (int(round(data[cidx][1][0])),
-                                              int(round(data[cidx][1][1]))), cSize)  # Render centroid cluster B
+            pygame.draw.circle(screen, GOLD, center[1], cSize)  # Render centroid cluster B
+
+
+# Preallocated debug preview
+@dataclass
+class PreviewBuffers:
+    """
+    Tiles and mosaic reused by the debug preview
+    """
+    tileSize: tuple
+    tiles: list
+    mosaic: np.ndarray
+
+    @classmethod
+    def allocate(cls, tileWidth, tileHeight):
+        """
+        :param tileWidth: width of a single frame tile
+        :param tileHeight: height of a single frame tile
+        :return: preview buffers for a 3x2 mosaic
+        """
+        tiles = [np.empty((tileHeight, tileWidth, 3), np.uint8)]  # Raw frame
+        tiles += [np.empty((tileHeight, tileWidth), np.uint8) for _ in range(5)]  # Gray frames
+        return cls((tileWidth, tileHeight), tiles, np.empty((2 * tileHeight, 3 * tileWidth, 3), np.uint8))
 
 
 # Display cameras
@@ -250,10 +476,19 @@ def displayAllFrames(data, sContours, sCentroid, dFrames):
             fidx = 4
         if sContours is False and sCentroid is False:
             fidx = 2
+
+        global previewBuffers
+        if previewBuffers is None:
+            previewBuffers = PreviewBuffers.allocate(width // 3, height // 3)
+        tileWidth, tileHeight = previewBuffers.tileSize
+
+        # Tile frames into one mosaic: raw, gray, blur on top; delta, threshold, dilated below
+        for i, frame in enumerate(data[fidx]):
+            tile = cv2.resize(frame, previewBuffers.tileSize, dst=previewBuffers.tiles[i],
+                              interpolation=cv2.INTER_AREA)
+            row, col = divmod(i, 3)
+            cell = previewBuffers.mosaic[row * tileHeight:(row + 1) * tileHeight, col * tileWidth:(col + 1) * tileWidth]
+            cell[:] = tile if tile.ndim == 3 else tile[:, :, None]  # Gray frames fill all three channels
+
         # Show frames
-        cv2.imshow("Frame0: Raw", data[fidx][0])
-        cv2.imshow("Frame1: Gray", data[fidx][1])
-        cv2.imshow("Frame2: Blur", data[fidx][2])
-        cv2.imshow("Frame3: Delta", data[fidx][3])
-        cv2.imshow("Frame4: Threshold", data[fidx][4])
-        cv2.imshow("Frame5: Dialated", data[fidx][5])
+        cv2.imshow("Frames: Raw, Gray, Blur / Delta, Threshold, Dialated", previewBuffers.mosaic)
@@ -24,10 +24,13 @@ def on_disconnect(gameClient, _, rc=0):
 
 # Receive message
 def on_message(gameClient, _, msg):
+    now = time.monotonic()
+    if now - mqttServ.lastUpdate < updateService:  # Rate limit without blocking the network loop
+        return
+    mqttServ.lastUpdate = now
     pse_output_msg = msg.payload.decode()
     mood, engagement = pse_output_msg.split(',')
     mqttServ.mood, mqttServ.engagement = mood, engagement
-    time.sleep(updateService)
 
 
 # Define MQTT Service
@@ -39,6 +42,7 @@ class MQTTService:
         self.state = 1
         self.mood = None
         self.engagement = None
+        self.lastUpdate = float('-inf')
 
     def update(self):
         """